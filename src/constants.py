@@ -3,3 +3,4 @@ from typing import Final
 
 INPUT_DATA_FILEPATH: Final[Path] = Path("data/sms_spam_collection/SMSSpamCollection")
 DB_FILEPATH: Final[Path] = Path("local_files/vector_db.duckdb")
+BM25S_INDEX_DIRPATH: Final[Path] = Path("local_files/bm25s_index")
@@ -1,74 +1,168 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Final
+
 import duckdb
 import numpy as np
 import polars as pl
 
 from src import constants, loggers
-from src.language_models import embed_model
+from src.language_models import EMBED_MODEL_NAME, embed_model
+
+try:
+    import bm25s
+except ImportError:
+    bm25s = None
 
 logger = loggers.get_logger(__name__)
 
-logger.info(f"Reading in data from {constants.INPUT_DATA_FILEPATH}")
-labels: list[str] = []
-message_texts: list[str] = []
-with open(constants.INPUT_DATA_FILEPATH, "r") as file:
-    for line in file.readlines():
-        label, message_text = line.split("\t", 1)
-        labels.append(label.strip())
-        message_texts.append(message_text.strip())
-main_df = pl.DataFrame({"label": labels, "msg_text": message_texts})
 
-logger.info("creating semantic embeddings")
-semantic_vectors_msg_text: np.ndarray = embed_model.encode(
-    main_df.get_column("msg_text").to_list()
-)
-main_df = main_df.with_columns(
-    pl.Series(
-        "vector_msg_text",
-        semantic_vectors_msg_text,
-    )
-)
+def build_index() -> None:
+    """
+    Read in the input data, embed it and (re)build the local duckdb database
+    (including the HNSW semantic vector index and the full-text search index)
+    """
+    logger.info(f"Reading in data from {constants.INPUT_DATA_FILEPATH}")
+    main_df = pl.read_csv(
+        constants.INPUT_DATA_FILEPATH,
+        separator="\t",
+        has_header=False,
+        new_columns=["label", "msg_text"],
+        quote_char=None,
+    ).with_columns(pl.col("msg_text").str.strip_chars())
 
-with duckdb.connect(constants.DB_FILEPATH) as con:
-    logger.info("Installing vector similarity search (VSS) extension")
-    con.execute(
-        """
-        -- install Vector Similarity Search extension
-        INSTALL vss;
-        LOAD vss;
-        SET hnsw_enable_experimental_persistence = true;
-        """
+    # corpus embeddings are cached on disk, keyed by a content hash of the
+    # embedding model name + every message text, so re-running this script on an
+    # unchanged corpus skips the (dominant) encoding cost entirely
+    embeddings_hasher = hashlib.blake2b(digest_size=16)
+    embeddings_hasher.update(EMBED_MODEL_NAME.encode("utf-8"))
+    for msg_text in main_df.get_column("msg_text"):
+        embeddings_hasher.update(msg_text.encode("utf-8"))
+        embeddings_hasher.update(b"\x00")
+    embeddings_cache_filepath: Path = (
+        constants.DB_FILEPATH.parent / f"embeddings_{embeddings_hasher.hexdigest()}.npy"
     )
-    logger.info(f"Writing to local database {constants.DB_FILEPATH}")
-    con.execute("DROP TABLE IF EXISTS main;")
-    con.sql(
-        """
-        CREATE TABLE    main
-        AS
-        SELECT  UUID() AS row_id
-            ,   * 
-        FROM    main_df 
-        ;
-    """
+
+    if embeddings_cache_filepath.exists():
+        logger.info(
+            f"loading cached semantic embeddings from {embeddings_cache_filepath}"
+        )
+        semantic_vectors_msg_text: np.ndarray = np.load(embeddings_cache_filepath)
+    else:
+        logger.info("creating semantic embeddings")
+        # encode in slices written straight into one preallocated array, so that
+        # peak memory is the final embeddings matrix plus a single batch of texts
+        # (never the whole corpus as a python list alongside a second model output)
+        # FLOAT32 is the narrowest vector dtype which duckdb supports:
+        # ARRAY_DISTANCE() and the HNSW index both require FLOAT[] (or DOUBLE[]) arrays
+        ENCODE_BATCH_SIZE: Final[int] = 1024
+        n_messages: int = main_df.height
+        semantic_vectors_msg_text = np.empty(
+            (n_messages, embed_model.dim),
+            dtype=np.float32,
+        )
+        for batch_start in range(0, n_messages, ENCODE_BATCH_SIZE):
+            msg_text_batch: list[str] = (
+                main_df.get_column("msg_text")
+                .slice(batch_start, ENCODE_BATCH_SIZE)
+                .to_list()
+            )
+            semantic_vectors_msg_text[
+                batch_start : batch_start + len(msg_text_batch)
+            ] = embed_model.encode(msg_text_batch, batch_size=ENCODE_BATCH_SIZE)
+            logger.info(
+                f"embedded {min(batch_start + ENCODE_BATCH_SIZE, n_messages)}/{n_messages} messages"
+            )
+        np.save(embeddings_cache_filepath, semantic_vectors_msg_text)
+        logger.info(f"cached semantic embeddings to {embeddings_cache_filepath}")
+    main_df = main_df.with_columns(
+        pl.Series(
+            "vector_msg_text",
+            semantic_vectors_msg_text,
+        )
     )
-    logger.info("Creating HNSW semantic vector index")
-    con.execute(
-        """
-        CREATE INDEX    semantic_vec_hnsw_index
-        ON              main 
-        USING           HNSW (vector_msg_text)
-        WITH            (metric = 'cosine')
-        ;
+
+    with duckdb.connect(constants.DB_FILEPATH) as con:
+        logger.info("Installing vector similarity search (VSS) extension")
+        con.execute(
+            """
+            -- install Vector Similarity Search extension
+            INSTALL vss;
+            LOAD vss;
+            SET hnsw_enable_experimental_persistence = true;
+            """
+        )
+        # HNSW construction parallelizes across inserted vectors, so let
+        # duckdb use every core for the index build
+        con.execute(f"SET threads = {os.cpu_count()};")
+        logger.info(f"Writing to local database {constants.DB_FILEPATH}")
+        con.execute("DROP TABLE IF EXISTS main;")
+        con.sql(
+            """
+            CREATE TABLE    main
+            AS
+            -- a 4-byte monotonic id: smaller than a UUID in the FTS
+            -- dictionary and result sets, and joins hash on ints
+            SELECT  CAST(row_number() OVER () AS INTEGER) AS row_id
+                ,   *
+            FROM    main_df
+            ;
         """
-    )
-    logger.info("Creating Full Text Search (FTS) index")
-    create_fts_index_query: str = """
-        PRAGMA CREATE_FTS_INDEX(
-            'main',         -- table name
-            'row_id',       -- doc identifier column
-            'msg_text',     -- column(s) to index
-            overwrite=1     -- overwrite existing index
-        );
-        """.strip()
-    logger.info("\n" + create_fts_index_query)
-    con.execute(create_fts_index_query)
-    logger.warning("FTS index does not automatically update when new data is inserted")
+        )
+        logger.info("Creating HNSW semantic vector index")
+        con.execute(
+            """
+            CREATE INDEX    semantic_vec_hnsw_index
+            ON              main
+            USING           HNSW (vector_msg_text)
+            WITH            (
+                                metric = 'ip',  -- vectors are unit-norm, so inner product == cosine
+                                ef_construction = 128,
+                                M = 16
+                            )
+            ;
+            """
+        )
+        logger.info("Creating Full Text Search (FTS) index")
+        create_fts_index_query: str = """
+            PRAGMA CREATE_FTS_INDEX(
+                'main',         -- table name
+                'row_id',       -- doc identifier column
+                'msg_text',     -- column(s) to index
+                overwrite=1     -- overwrite existing index
+            );
+            """.strip()
+        logger.info("\n" + create_fts_index_query)
+        con.execute(create_fts_index_query)
+        logger.warning(
+            "FTS index does not automatically update when new data is inserted"
+        )
+
+        if bm25s is None:
+            logger.info(
+                "bm25s is not installed - skipping the in-process BM25 index"
+            )
+        else:
+            logger.info("Building in-process bm25s index")
+            bm25s_corpus: list[dict] = con.sql(
+                """
+                SELECT  row_id
+                    ,   msg_text
+                FROM    main
+                ;
+                """
+            ).pl().to_dicts()
+            bm25s_retriever = bm25s.BM25()
+            bm25s_retriever.index(
+                bm25s.tokenize([record["msg_text"] for record in bm25s_corpus])
+            )
+            bm25s_retriever.save(
+                str(constants.BM25S_INDEX_DIRPATH),
+                corpus=bm25s_corpus,
+            )
+            logger.info(f"saved bm25s index to {constants.BM25S_INDEX_DIRPATH}")
+
+
+if __name__ == "__main__":
+    build_index()
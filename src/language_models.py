@@ -1,3 +1,12 @@
+from typing import Final
+
 import model2vec
 
-embed_model = model2vec.StaticModel.from_pretrained("minishlab/potion-base-8M")
+EMBED_MODEL_NAME: Final[str] = "minishlab/potion-base-8M"
+
+# normalize=True makes every embedding unit-length, so cosine distance
+# reduces to a (cheaper) inner product at index- and query-time
+embed_model = model2vec.StaticModel.from_pretrained(
+    EMBED_MODEL_NAME,
+    normalize=True,
+)
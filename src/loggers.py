@@ -1,11 +1,13 @@
 import logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-    datefmt="%H:%M:%S",
-)
-
 
 def get_logger(name: str):
+    # only configure the root logger if nothing else has done so already
+    # (so importing this module repeatedly, or from library code, is free)
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(
+            level=logging.INFO,
+            format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+            datefmt="%H:%M:%S",
+        )
     return logging.getLogger(name)
@@ -1,3 +1,4 @@
+import functools
 from typing import Final, Literal
 
 import duckdb
@@ -7,13 +8,166 @@ from src import constants
 from src.language_models import embed_model
 
 
+@functools.lru_cache(maxsize=1)
+def get_db_connection() -> duckdb.DuckDBPyConnection:
+    """
+    Return the shared read-only connection to the local duckdb database
+    (the connection is created on first use and then reused, so that each
+    search does not pay the cost of re-opening the database file and
+    re-loading the HNSW/FTS index metadata)
+    """
+    conn = duckdb.connect(constants.DB_FILEPATH, read_only=True)
+    conn.execute("LOAD vss;")
+    return conn
+
+
+@functools.lru_cache(maxsize=256)
+def embed_user_query(user_query: str) -> tuple[float, ...]:
+    """
+    Return the semantic embedding of `user_query`, memoizing recent queries
+    so that repeated searches (and the multiple retrievers within a single
+    hybrid search) pay for at most one model forward pass per unique query
+    """
+    return tuple(embed_model.encode(user_query).tolist())
+
+
+@functools.lru_cache(maxsize=1)
+def get_bm25s_retriever():
+    """
+    Load (once) the in-process bm25s index built by `src.db_setup`
+    """
+    import bm25s
+
+    return bm25s.BM25.load(
+        str(constants.BM25S_INDEX_DIRPATH),
+        load_corpus=True,
+    )
+
+
+# the SQL statement texts are fixed (all per-call values arrive as bound
+# parameters), so each one is built exactly once at import time and duckdb
+# sees an identical statement on every call
+BM25_SQL_QUERY: Final[str] = """
+        SELECT      'fts_bm25' AS 'search_method'
+                ,   row_id
+                ,   msg_text
+                ,   score
+                ,   ROW_NUMBER() OVER (ORDER BY score DESC, row_id) AS rank
+        FROM    (
+                    -- filter + top-k before the window function, so only
+                    -- $top_k rows (not the whole table) get materialized
+                    -- and ranked
+                    SELECT      row_id
+                            ,   msg_text
+                            ,   fts_main_main.MATCH_BM25(
+                                    row_id,
+                                    $user_query,
+                                    fields := 'msg_text'
+                                ) AS score
+                    FROM        main
+                    WHERE       score IS NOT NULL
+                    ORDER BY    score DESC
+                    LIMIT       $top_k
+                ) bm
+        ORDER BY    score DESC, row_id
+        ;
+    """
+
+SEMANTIC_SQL_QUERY: Final[str] = """
+        SELECT      'semantic' AS 'search_method'
+                ,   row_id
+                ,   msg_text
+                ,   ROW_NUMBER() OVER (ORDER BY similarity_score, row_id) AS rank
+        FROM    (
+                    SELECT  row_id
+                        ,   msg_text
+                        ,   ARRAY_NEGATIVE_INNER_PRODUCT(
+                                vector_msg_text,
+                                $query_vec::FLOAT[256]
+                            ) AS similarity_score
+                    FROM    main
+            )
+        ORDER BY    similarity_score
+        LIMIT       $top_k
+        ;
+    """
+
+HYBRID_RRF_SQL_QUERY: Final[str] = """
+        WITH bm25_results AS (
+            SELECT      row_id
+                    ,   msg_text
+                    ,   ROW_NUMBER() OVER (ORDER BY score DESC, row_id) AS rank
+            FROM    (
+                        SELECT      row_id
+                                ,   msg_text
+                                ,   fts_main_main.MATCH_BM25(
+                                        row_id,
+                                        $user_query,
+                                        fields := 'msg_text'
+                                    ) AS score
+                        FROM        main
+                        WHERE       score IS NOT NULL
+                        ORDER BY    score DESC
+                        LIMIT       $prefetch_k
+                    ) bm
+        ),
+        semantic_results AS (
+            SELECT      row_id
+                    ,   msg_text
+                    ,   ROW_NUMBER() OVER (ORDER BY similarity_score, row_id) AS rank
+            FROM    (
+                        SELECT  row_id
+                            ,   msg_text
+                            ,   ARRAY_NEGATIVE_INNER_PRODUCT(
+                                    vector_msg_text,
+                                    $query_vec::FLOAT[256]
+                                ) AS similarity_score
+                        FROM    main
+                    )
+            ORDER BY    similarity_score
+            LIMIT       $prefetch_k
+        ),
+        missing_rank AS (
+            -- rank given to a document only found by one of the retrievers
+            SELECT  GREATEST(
+                        (SELECT COALESCE(MAX(rank), 0) FROM bm25_results),
+                        (SELECT COALESCE(MAX(rank), 0) FROM semantic_results)
+                    ) + 1 AS rank
+        ),
+        fused AS (
+            SELECT  COALESCE(b.row_id, s.row_id) AS row_id
+                ,   COALESCE(b.msg_text, s.msg_text) AS msg_text
+                ,   ($bm25_weight / (COALESCE(b.rank, m.rank) + $rrf_constant))
+                  + ($semantic_weight / (COALESCE(s.rank, m.rank) + $rrf_constant)) AS score
+            FROM                bm25_results b
+            FULL OUTER JOIN     semantic_results s
+            ON                  b.row_id = s.row_id
+            CROSS JOIN          missing_rank m
+        )
+        SELECT      'hybrid_rrf' AS search_method
+                ,   row_id
+                ,   msg_text
+                ,   score
+                ,   ROW_NUMBER() OVER (ORDER BY score DESC) AS rank
+        FROM        fused
+        ORDER BY    score DESC
+        LIMIT       $top_k
+        ;
+    """
+
+
 def bm25(
     user_query: str,
     top_k: int = 10,
     output_format: Literal["python_list", "polars"] = "python_list",
+    backend: Literal["duckdb", "bm25s"] = "duckdb",
 ) -> list[dict] | pl.DataFrame:
     """
     Return `top_k` closest results to `user_query` using BM25 (full-text search)
+
+    `backend='bm25s'` scores against an in-process bm25s index (much faster
+    than the duckdb FTS round trip on small corpora); if the optional bm25s
+    package is not installed then the duckdb backend is used instead
     """
     SUPPORTED_OUTPUT_FORMATS: Final[list[str]] = ["python_list", "polars"]
     if output_format not in SUPPORTED_OUTPUT_FORMATS:
@@ -23,55 +177,54 @@ def bm25(
             + ",".join([f"'{x}'" for x in SUPPORTED_OUTPUT_FORMATS])
             + "]"
         )
-    sql_query: str = """
-        SELECT      'fts_bm25' AS 'search_method'
-                ,   row_id 
-                ,   msg_text
-                ,   score
-                ,   ROW_NUMBER() OVER (ORDER BY score DESC, RANDOM()) AS rank
-        FROM    (
-                    SELECT  *
-                        ,   fts_main_main.MATCH_BM25(
-                                row_id,
-                                $user_query,
-                                fields := 'msg_text'
-                            ) AS score
-                    FROM    main
-                ) bm 
-        WHERE       score IS NOT NULL
-        ORDER BY    score DESC
-        LIMIT       $top_k 
-        ;
-    """
-    with duckdb.connect(constants.DB_FILEPATH) as conn:
+    SUPPORTED_BACKENDS: Final[list[str]] = ["duckdb", "bm25s"]
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(
+            f"backend='{backend}' is not currently supported"
+            + "\nAvailable backends are ["
+            + ",".join([f"'{x}'" for x in SUPPORTED_BACKENDS])
+            + "]"
+        )
+    if backend == "bm25s":
+        try:
+            import bm25s
+        except ImportError:
+            backend = "duckdb"  # bm25s not installed - fall back to duckdb FTS
+
+    if backend == "bm25s":
+        retriever = get_bm25s_retriever()
+        docs, scores = retriever.retrieve(
+            bm25s.tokenize(user_query, show_progress=False),
+            k=min(top_k, len(retriever.corpus)),
+            show_progress=False,
+        )
+        result_rows: list[dict] = [
+            {
+                "search_method": "bm25s",
+                "row_id": doc["row_id"],
+                "msg_text": doc["msg_text"],
+                "score": float(score),
+                "rank": rank,
+            }
+            for rank, (doc, score) in enumerate(zip(docs[0], scores[0]), start=1)
+        ]
         if output_format == "python_list":
-            cursor = conn.execute(
-                query=sql_query,
-                parameters={
-                    "user_query": user_query,
-                    "top_k": top_k,
-                },
-            )
-            col_names: list[str] = [col_data[0] for col_data in cursor.description]
-            rows: list[tuple] = cursor.fetchall()
-
-            result = [
-                dict(
-                    zip(
-                        col_names,
-                        row,
-                    ),
-                )
-                for row in rows
-            ]
-        elif output_format == "polars":
-            result = conn.sql(
-                query=sql_query,
-                params={
-                    "user_query": user_query,
-                    "top_k": top_k,
-                },
-            ).pl()
+            return result_rows
+        return pl.DataFrame(result_rows)
+
+    with get_db_connection().cursor() as conn:
+        arrow_table = conn.execute(
+            query=BM25_SQL_QUERY,
+            parameters={
+                "user_query": user_query,
+                "top_k": top_k,
+            },
+        ).fetch_arrow_table()
+
+    if output_format == "python_list":
+        result = arrow_table.to_pylist()
+    elif output_format == "polars":
+        result = pl.from_arrow(arrow_table)
 
     return result
 
@@ -80,10 +233,15 @@ def semantic(
     user_query: str,
     top_k: int = 10,
     output_format: Literal["python_list", "polars"] = "python_list",
+    precomputed_embedding: tuple[float, ...] | None = None,
 ) -> list[dict] | pl.DataFrame:
     """
     Return `top_k` closest results to `user_query` using semantic search
     (over the semantic embedding vectors)
+
+    If `precomputed_embedding` is provided then it is used as the query
+    vector (saving a model forward pass e.g. when the caller has already
+    embedded `user_query`)
     """
     SUPPORTED_OUTPUT_FORMATS: Final[list[str]] = ["python_list", "polars"]
     if output_format not in SUPPORTED_OUTPUT_FORMATS:
@@ -93,51 +251,24 @@ def semantic(
             + ",".join([f"'{x}'" for x in SUPPORTED_OUTPUT_FORMATS])
             + "]"
         )
-    user_query_embedding: list[float] = embed_model.encode(user_query).tolist()
-    sql_query: str = f"""
-        SELECT      'semantic' AS 'search_method'
-                ,   row_id
-                ,   msg_text
-                ,   ROW_NUMBER() OVER (ORDER BY similarity_score, RANDOM()) AS rank
-        FROM    (
-                    SELECT  row_id
-                        ,   msg_text
-                        ,   ARRAY_DISTANCE(
-                                vector_msg_text, 
-                                {user_query_embedding}::FLOAT[256]
-                            ) AS similarity_score 
-                    FROM    main
-            )
-        ORDER BY    similarity_score
-        LIMIT       $top_k
-        ;
-    """
-    with duckdb.connect(constants.DB_FILEPATH) as conn:
-        if output_format == "python_list":
-            cursor = conn.execute(
-                query=sql_query,
-                parameters={
-                    "top_k": top_k,
-                },
-            )
-            col_names: list[str] = [col_data[0] for col_data in cursor.description]
-            rows: list[tuple] = cursor.fetchall()
-            result = [
-                dict(
-                    zip(
-                        col_names,
-                        row,
-                    ),
-                )
-                for row in rows
-            ]
-        elif output_format == "polars":
-            result = conn.sql(
-                query=sql_query,
-                params={
-                    "top_k": top_k,
-                },
-            ).pl()
+    user_query_embedding: list[float] = list(
+        precomputed_embedding
+        if precomputed_embedding is not None
+        else embed_user_query(user_query)
+    )
+    with get_db_connection().cursor() as conn:
+        arrow_table = conn.execute(
+            query=SEMANTIC_SQL_QUERY,
+            parameters={
+                "query_vec": user_query_embedding,
+                "top_k": top_k,
+            },
+        ).fetch_arrow_table()
+
+    if output_format == "python_list":
+        result = arrow_table.to_pylist()
+    elif output_format == "polars":
+        result = pl.from_arrow(arrow_table)
 
     return result
 
@@ -148,10 +279,21 @@ def hybrid_rrf(
     top_k: int = 10,
     output_format: Literal["python_list", "polars"] = "python_list",
     high_rank_mitigation_constant: int = 60,
+    weights: tuple[float, float] = (1.0, 1.0),
+    bm25_dominance_threshold: float | None = None,
 ) -> list[dict] | pl.DataFrame:
     """
     Return `top_k` closest results to `user_query` using Reciprocal Rank Fusion hybrid search
     (combines both BM25 and semantic search)
+
+    `weights` is (bm25_weight, semantic_weight) - each weight multiplies the
+    corresponding retriever's term in the RRF score, biasing the fusion
+    toward one retriever
+
+    If `bm25_dominance_threshold` is set and BM25 alone already returns at
+    least `top_k` results whose best score reaches the threshold, those BM25
+    results are returned directly and the (more expensive) semantic
+    retrieval is skipped entirely
     """
     SUPPORTED_OUTPUT_FORMATS: Final[list[str]] = ["python_list", "polars"]
     if output_format not in SUPPORTED_OUTPUT_FORMATS:
@@ -161,87 +303,49 @@ def hybrid_rrf(
             + ",".join([f"'{x}'" for x in SUPPORTED_OUTPUT_FORMATS])
             + "]"
         )
-    bm25_df: pl.DataFrame = (
-        bm25(
+    # an unambiguous BM25 hit can skip the semantic retriever entirely
+    # (the probe only retrieves top_k rows - the highest-scoring ones - so a
+    # query which fails the dominance check has paid for a top_k retrieval,
+    # not a full prefetch_k one, before falling through to the fusion below)
+    if bm25_dominance_threshold is not None:
+        bm25_df: pl.DataFrame = bm25(
             user_query=user_query,
-            top_k=prefetch_k,
+            top_k=top_k,
             output_format="polars",
         )
-        .select(
-            [
-                "row_id",
-                "msg_text",
-                "rank",
-            ]
-        )
-        .rename(lambda colname: f"bm25_{colname}" if colname != "row_id" else colname)
-    )
-    semantic_df: pl.DataFrame = semantic(
-        user_query=user_query,
-        top_k=prefetch_k,
-        output_format="polars",
-    )
+        if (
+            len(bm25_df) >= top_k
+            and bm25_df.get_column("score").max() >= bm25_dominance_threshold
+        ):
+            if output_format == "python_list":
+                return bm25_df.to_dicts()
+            return bm25_df
 
-    # if BM25 returns no results, fall back to semantic search #
-    if len(bm25_df) == 0:
-        semantic_df = semantic_df.bottom_k(top_k, by="rank").sort(
-            "rank",
-            descending=False,
-        )
-        if output_format == "python_list":
-            return semantic_df.to_dicts()
-        else:
-            return semantic_df
-
-    semantic_df = semantic_df.select(
-        [
-            "row_id",
-            "msg_text",
-            "rank",
-        ]
-    ).rename(lambda colname: f"semantic_{colname}" if colname != "row_id" else colname)
+    bm25_weight, semantic_weight = weights
 
-    combined_df: pl.DataFrame = bm25_df.join(
-        semantic_df,
-        on="row_id",
-        how="full",
-        validate="1:1",
-    )
-    assign_rank_to_missing: int = (
-        max(
-            bm25_df.get_column("bm25_rank").max(),
-            semantic_df.get_column("semantic_rank").max(),
-        )
-        + 1
-    )
-    combined_df = combined_df.with_columns(
-        pl.col("bm25_rank").fill_null(assign_rank_to_missing),
-        pl.col("semantic_rank").fill_null(assign_rank_to_missing),
-    )
-    combined_df = combined_df.with_columns(
-        (
-            (1 / (pl.col("bm25_rank") + high_rank_mitigation_constant))
-            + (1 / (pl.col("semantic_rank") + high_rank_mitigation_constant))
-        ).alias("score")
-    )
-    combined_df = combined_df.top_k(top_k, by="score").sort("score", descending=True)
-    combined_df = combined_df.with_row_index("rank", offset=1)
-    combined_df = combined_df.with_columns(pl.lit("hybrid_rrf").alias("search_method"))
-    combined_df = combined_df.with_columns(
-        pl.col("bm25_msg_text").fill_null(pl.col("semantic_msg_text")).alias("msg_text")
-    )
-    combined_df = combined_df.select(
-        [
-            "search_method",
-            "row_id",
-            "msg_text",
-            "score",
-            "rank",
-        ]
-    )
+    # embed the query once up front (duckdb does the rest of the work)
+    user_query_embedding: list[float] = list(embed_user_query(user_query))
 
-    if output_format == "python_list":
-        return combined_df.to_dicts()
+    # both retrievals, the rank fusion and the final top-k all happen in a
+    # single duckdb query plan (if BM25 matches nothing, the FULL OUTER JOIN
+    # degrades gracefully to the semantic ranking)
+    with get_db_connection().cursor() as conn:
+        arrow_table = conn.execute(
+            query=HYBRID_RRF_SQL_QUERY,
+            parameters={
+                "user_query": user_query,
+                "query_vec": user_query_embedding,
+                "prefetch_k": prefetch_k,
+                "rrf_constant": high_rank_mitigation_constant,
+                "bm25_weight": bm25_weight,
+                "semantic_weight": semantic_weight,
+                "top_k": top_k,
+            },
+        ).fetch_arrow_table()
 
+    if output_format == "python_list":
+        result = arrow_table.to_pylist()
     elif output_format == "polars":
-        return combined_df
+        result = pl.from_arrow(arrow_table)
+
+    return result
@@ -2,6 +2,7 @@
 The main entry script of the streamlit web app frontend
 """
 
+import polars as pl
 import streamlit as st
 
 from src import constants, search
@@ -9,33 +10,61 @@ from src import constants, search
 st.set_page_config(page_title="duckdb-as-vecdb", layout="wide")
 st.title("DuckDB as a Vector Database")
 
-search_method = st.radio("Select Search Method", ["BM25", "semantic", "hybrid (RRF)"])
 
-user_query: str = st.text_input("Enter your search query")
+@st.cache_resource
+def init_db_connection():
+    """
+    Open the duckdb database connection once and keep it alive across app reruns
+    """
+    return search.get_db_connection()
 
-top_k = st.number_input(
-    "Number of results to return", min_value=1, max_value=999, value=5
-)
 
-if st.button("Search") and user_query:
+init_db_connection()
+
+
+@st.cache_data(ttl=300)
+def run_search(search_method: str, user_query: str, top_k: int) -> pl.DataFrame:
+    """
+    Run the selected search, memoizing results for 5 minutes so that a
+    repeated (method, query, top_k) combination is served from RAM instead
+    of re-running the embedding model and database query
+    """
     if search_method == "BM25":
-        results_df = search.bm25(
+        return search.bm25(
             user_query=user_query,
             top_k=top_k,
             output_format="polars",
         )
     elif search_method == "semantic":
-        results_df = search.semantic(
-            user_query=user_query, top_k=top_k, output_format="polars"
+        return search.semantic(
+            user_query=user_query,
+            top_k=top_k,
+            output_format="polars",
         )
     elif search_method == "hybrid (RRF)":
-        results_df = search.hybrid_rrf(
+        return search.hybrid_rrf(
             user_query=user_query,
             prefetch_k=500,
             top_k=top_k,
             output_format="polars",
         )
 
+
+search_method = st.radio("Select Search Method", ["BM25", "semantic", "hybrid (RRF)"])
+
+user_query: str = st.text_input("Enter your search query")
+
+top_k = st.number_input(
+    "Number of results to return", min_value=1, max_value=999, value=5
+)
+
+if st.button("Search") and user_query:
+    results_df = run_search(
+        search_method=search_method,
+        user_query=user_query,
+        top_k=top_k,
+    )
+
     st.subheader("Search Results")
     st.dataframe(results_df)
 